@@ -4,8 +4,9 @@ RunningHub 工作流浏览器
 集成数据采集和 Web 展示功能
 """
 
-from flask import Flask, render_template, jsonify, send_from_directory
+from flask import Flask, render_template, jsonify, send_from_directory, send_file, request
 from pathlib import Path
+import hmac
 import json
 import os
 from datetime import datetime
@@ -13,24 +14,54 @@ import threading
 import time
 from dotenv import load_dotenv
 from fetch_workflows import WorkflowFetcher
+from image_cache import ImageCache, ImageCacheError
+from node_index import NodeIndex
+from profiler import profiler
 
 app = Flask(__name__)
 
 # 基础目录设置
 BASE_DIR = Path(__file__).parent
-DATA_DIR = BASE_DIR / "data"
-TEMPLATE_DIR = BASE_DIR / "templates"
-STATIC_DIR = BASE_DIR / "static"
 
 # 加载环境变量
 env_path = BASE_DIR / ".env"
 if env_path.exists():
     load_dotenv(env_path)
 
+# 数据和缓存目录可通过环境变量覆盖（压测时指向临时目录）
+DATA_DIR = Path(os.getenv('DATA_DIR') or BASE_DIR / "data")
+TEMPLATE_DIR = BASE_DIR / "templates"
+STATIC_DIR = BASE_DIR / "static"
+CACHE_DIR = Path(os.getenv('CACHE_DIR') or BASE_DIR / "cache")
+
+# RunningHub API 地址
+API_BASE = os.getenv('RUNNINGHUB_API_BASE', 'https://www.runninghub.cn').rstrip('/')
+
 # 创建必要的目录
-DATA_DIR.mkdir(exist_ok=True)
+DATA_DIR.mkdir(parents=True, exist_ok=True)
 TEMPLATE_DIR.mkdir(exist_ok=True)
 STATIC_DIR.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# 封面图片缓存（代理域名白名单为空时使用 RunningHub 默认图片域名）
+image_cache = ImageCache(
+    str(CACHE_DIR / "images"),
+    allowed_hosts=os.getenv('IMAGE_PROXY_ALLOWED_HOSTS', '').split(',')
+)
+# 抓取完成后预取的封面数量（0 表示不预取）
+IMAGE_PREFETCH_COUNT = int(os.getenv('IMAGE_PREFETCH_COUNT', 60))
+
+# 点击查看工作流时缓存内容的有效期（秒），超过后重新从 RunningHub 获取
+WORKFLOW_CACHE_MAX_AGE = int(os.getenv('WORKFLOW_CACHE_MAX_AGE', 3600))
+# 工作流节点类型索引（批量获取工作流内容时的并发数）
+node_index = NodeIndex(
+    str(BASE_DIR), str(CACHE_DIR), str(DATA_DIR),
+    max_workers=int(os.getenv('NODE_INDEX_WORKERS', 4))
+)
+
+# 按需性能剖析（抽样比例可通过管理接口在运行时调整）
+profiler.set_log_dir(os.getenv('PROFILE_DIR') or str(BASE_DIR / "logs" / "profiles"))
+profiler.configure(sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)))
 
 # 全局变量：刷新状态
 refresh_status = {
@@ -53,25 +84,44 @@ def get_data_files(search=None):
     
     files = []
     
-    if search:
-        # 获取指定搜索关键词的文件
-        search_dir = DATA_DIR / search
-        if search_dir.exists():
-            files = list(search_dir.glob("workflows_*.json"))
-    else:
-        # 兼容旧格式：获取根目录下的文件
-        files = list(DATA_DIR.glob("workflows_*.json"))
+    with profiler.stage('file_io'):
+        if search:
+            # 获取指定搜索关键词的文件
+            search_dir = DATA_DIR / search
+            if search_dir.exists():
+                files = list(search_dir.glob("workflows_*.json"))
+        else:
+            # 兼容旧格式：获取根目录下的文件
+            files = list(DATA_DIR.glob("workflows_*.json"))
+            
+            # 同时获取所有子目录中的文件
+            for subdir in DATA_DIR.iterdir():
+                if subdir.is_dir():
+                    files.extend(subdir.glob("workflows_*.json"))
         
-        # 同时获取所有子目录中的文件
-        for subdir in DATA_DIR.iterdir():
-            if subdir.is_dir():
-                files.extend(subdir.glob("workflows_*.json"))
+        mtimes = {f: f.stat().st_mtime for f in files}
     
     # 按文件修改时间降序排序
-    files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
+    with profiler.stage('sort'):
+        files.sort(key=mtimes.get, reverse=True)
     return files
 
 
+def load_json_file(filepath):
+    """读取 JSON 数据文件（文件读取和解析分别计时）"""
+    with profiler.stage('file_io'):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            text = f.read()
+    with profiler.stage('json_load'):
+        return json.loads(text)
+
+
+def profiled_jsonify(data):
+    """jsonify 并计时（大快照的序列化开销不小）"""
+    with profiler.stage('jsonify'):
+        return jsonify(data)
+
+
 def parse_filename_timestamp(filename):
     """从文件名解析时间戳"""
     try:
@@ -93,6 +143,12 @@ def refresh_data_background(search="换装", max_pages=None):
         refresh_status['total'] = total
         refresh_status['message'] = message
     
+    # 管理接口开启了抓取剖析时，记录本次抓取各阶段耗时
+    profiling = profiler.take_crawl()
+    if profiling:
+        profiler.start('crawl', search or 'all')
+    filepath = None
+    
     try:
         refresh_status['is_running'] = True
         refresh_status['current'] = 0
@@ -101,11 +157,18 @@ def refresh_data_background(search="换装", max_pages=None):
         refresh_status['error'] = None
         
         # 创建采集器并运行（传递页数限制）
-        fetcher = WorkflowFetcher(str(BASE_DIR))
+        fetcher = WorkflowFetcher(str(BASE_DIR), str(DATA_DIR))
         filepath = fetcher.run(search=search, max_pages=max_pages, callback=progress_callback)
         
         if filepath:
             refresh_status['message'] = '数据刷新完成！'
+            # 后台预取新快照前排的封面图
+            if IMAGE_PREFETCH_COUNT > 0:
+                threading.Thread(
+                    target=image_cache.prefetch_snapshot,
+                    args=(filepath, IMAGE_PREFETCH_COUNT),
+                    daemon=True
+                ).start()
         else:
             refresh_status['error'] = '数据刷新失败'
             
@@ -114,6 +177,51 @@ def refresh_data_background(search="换装", max_pages=None):
         print(f"后台刷新出错: {e}")
     finally:
         refresh_status['is_running'] = False
+        if profiling:
+            profiler.finish(
+                max_pages=max_pages,
+                filepath=filepath,
+                error=refresh_status['error']
+            )
+
+
+@app.before_request
+def start_request_profile():
+    """按抽样比例开启请求剖析（管理接口本身不剖析）"""
+    if (request.path.startswith('/api/') and not request.path.startswith('/api/admin/')
+            and profiler.should_sample()):
+        profiler.start('request', f"{request.method} {request.path}")
+
+
+@app.after_request
+def annotate_request_profile(response):
+    """记录响应状态和大小"""
+    if profiler.active:
+        profiler.annotate(
+            status=response.status_code,
+            content_length=response.calculate_content_length()
+        )
+    return response
+
+
+@app.teardown_request
+def finish_request_profile(exc):
+    """结束请求剖析并保存"""
+    if profiler.active:
+        profiler.finish(error=str(exc) if exc else None)
+
+
+def check_admin_token():
+    """校验管理接口令牌（未配置 ADMIN_TOKEN 时只允许本机访问）"""
+    token = os.getenv('ADMIN_TOKEN')
+    if not token:
+        if request.remote_addr in ('127.0.0.1', '::1'):
+            return None
+        return jsonify({'error': '未配置 ADMIN_TOKEN，管理接口仅允许本机访问'}), 403
+    provided = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8')):
+        return jsonify({'error': '未授权'}), 401
+    return None
 
 
 @app.route('/')
@@ -128,14 +236,15 @@ def list_files():
     files = get_data_files()
     file_list = []
     
-    for f in files:
-        file_list.append({
-            'filename': f.name,
-            'timestamp': parse_filename_timestamp(f),
-            'size': f.stat().st_size
-        })
+    with profiler.stage('file_io'):
+        for f in files:
+            file_list.append({
+                'filename': f.name,
+                'timestamp': parse_filename_timestamp(f),
+                'size': f.stat().st_size
+            })
     
-    return jsonify(file_list)
+    return profiled_jsonify(file_list)
 
 
 @app.route('/api/data/<filename>')
@@ -147,9 +256,8 @@ def get_data(filename):
         return jsonify({'error': '文件不存在'}), 404
     
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data)
+        data = load_json_file(filepath)
+        return profiled_jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -165,9 +273,8 @@ def get_latest():
     latest_file = files[0]
     
     try:
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data)
+        data = load_json_file(latest_file)
+        return profiled_jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -194,9 +301,8 @@ def get_search_data(search=''):
     latest_file = files[0]
     
     try:
-        with open(latest_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return jsonify(data)
+        data = load_json_file(latest_file)
+        return profiled_jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -256,7 +362,7 @@ def get_total_pages():
     # 从环境变量读取 token
     auth_token = os.getenv("RUNNINGHUB_AUTH_TOKEN")
     
-    url = "https://www.runninghub.cn/api/search/workflow"
+    url = f"{API_BASE}/api/search/workflow"
     
     # 参考 fetch_workflows.py 的完整请求头
     headers = {
@@ -325,37 +431,44 @@ def list_searches():
     searches = []
     
     # 获取所有子目录（搜索关键词）
-    for subdir in DATA_DIR.iterdir():
-        if subdir.is_dir():
+    with profiler.stage('file_io'):
+        subdirs = [d for d in DATA_DIR.iterdir() if d.is_dir()]
+    for subdir in subdirs:
+        with profiler.stage('file_io'):
             files = list(subdir.glob("workflows_*.json"))
-            if files:
-                # 获取最新文件的信息
-                latest_file = max(files, key=lambda f: f.stat().st_mtime)
-                try:
-                    with open(latest_file, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                    searches.append({
-                        'keyword': subdir.name,
-                        'count': data.get('total_count', 0),
-                        'last_update': data.get('fetch_time', '')
-                    })
-                except:
-                    pass
-    
-    return jsonify(searches)
+            # 获取最新文件的信息
+            latest_file = max(files, key=lambda f: f.stat().st_mtime) if files else None
+        if latest_file:
+            try:
+                data = load_json_file(latest_file)
+                searches.append({
+                    'keyword': subdir.name,
+                    'count': data.get('total_count', 0),
+                    'last_update': data.get('fetch_time', '')
+                })
+            except:
+                pass
+    
+    return profiled_jsonify(searches)
 
 
 @app.route('/api/workflow/<workflow_id>')
 def get_workflow_detail(workflow_id):
-    """API: 获取工作流详细信息（包含 workflowContent）"""
+    """API: 获取工作流详细信息（包含 workflowContent），?refresh=1 跳过缓存"""
     import requests
     
+    # 未过期的缓存内容直接返回
+    if request.args.get('refresh') != '1':
+        cached = node_index.get_cached_detail(workflow_id, max_age=WORKFLOW_CACHE_MAX_AGE)
+        if cached:
+            return profiled_jsonify(cached)
+    
     # 从环境变量读取 token
     auth_token = os.getenv("RUNNINGHUB_AUTH_TOKEN")
     if not auth_token:
         return jsonify({'error': '未配置 RUNNINGHUB_AUTH_TOKEN 环境变量'}), 500
     
-    url = "https://www.runninghub.cn/api/workflow/copy"
+    url = f"{API_BASE}/api/workflow/copy"
     headers = {
         "accept": "application/json, text/plain, */*",
         "authorization": auth_token,
@@ -367,18 +480,167 @@ def get_workflow_detail(workflow_id):
     }
     
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        response.raise_for_status()
-        result = response.json()
+        with profiler.stage('upstream'):
+            response = requests.post(url, json=payload, headers=headers, timeout=10)
+            response.raise_for_status()
+            result = response.json()
         
         if result.get('code') == 0:
-            return jsonify(result.get('data', {}))
+            detail = result.get('data', {})
+            if detail:
+                # 顺便缓存并加入节点索引（索引文件延迟保存）
+                node_index.store_detail(workflow_id, detail)
+                node_index.schedule_save()
+            return profiled_jsonify(detail)
         else:
             return jsonify({'error': result.get('msg', '获取失败')}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/node-index', methods=['POST'])
+def build_node_index():
+    """API: 为指定搜索关键词的最新快照建立节点索引"""
+    if node_index.status['is_running']:
+        return jsonify({
+            'success': False,
+            'message': '节点索引正在建立中，请稍候...'
+        })
+    
+    search = ''
+    refresh = False
+    if request.is_json:
+        data = request.get_json()
+        search = data.get('search', '')
+        refresh = bool(data.get('refresh', False))
+    
+    # 空搜索使用特殊文件夹名 "all"
+    search_key = search if search and search != 'all' else 'all'
+    files = get_data_files(search_key)
+    if not files:
+        return jsonify({'success': False, 'message': f'没有 "{search_key}" 的数据文件'}), 404
+    
+    thread = threading.Thread(
+        target=node_index.build_from_snapshot,
+        args=(str(files[0]), refresh),
+        daemon=True
+    )
+    thread.start()
+    
+    return jsonify({
+        'success': True,
+        'message': f'开始为 {files[0].name} 建立节点索引'
+    })
+
+
+@app.route('/api/node-index/status')
+def get_node_index_status():
+    """API: 获取节点索引建立状态"""
+    status = dict(node_index.status)
+    status['indexed'] = len(node_index.entries)
+    return jsonify(status)
+
+
+@app.route('/api/nodes')
+def list_node_types():
+    """API: 列出所有已索引的节点类型及使用数量"""
+    return jsonify(node_index.summary('node_types'))
+
+
+@app.route('/api/nodes/<path:class_type>')
+def find_workflows_by_node(class_type):
+    """API: 查询使用指定节点类型的工作流"""
+    return jsonify(node_index.find_by_node_type(class_type))
+
+
+@app.route('/api/models')
+def list_models():
+    """API: 列出所有已索引的模型文件及使用数量"""
+    return jsonify(node_index.summary('models'))
+
+
+@app.route('/api/models/<path:filename>')
+def find_workflows_by_model(filename):
+    """API: 查询使用指定模型文件的工作流"""
+    return jsonify(node_index.find_by_model(filename))
+
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_config():
+    """API: 查看或调整剖析配置（sample_rate: 请求抽样比例，profile_next_crawl: 剖析接下来几次抓取）"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            profile_next_crawl = data.get('profile_next_crawl')
+            if isinstance(profile_next_crawl, bool):
+                profile_next_crawl = int(profile_next_crawl)
+            profiler.configure(
+                sample_rate=data.get('sample_rate'),
+                profile_next_crawl=profile_next_crawl
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'参数错误: {e}'}), 400
+    
+    return jsonify(profiler.config())
+
+
+@app.route('/api/admin/profiles')
+def list_profiles():
+    """API: 最近的剖析记录及耗时热点汇总"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    limit = request.args.get('limit', 20, type=int)
+    kind = request.args.get('kind')
+    return jsonify({
+        'config': profiler.config(),
+        'hotspots': profiler.hotspots(limit=10, kind=kind),
+        'profiles': profiler.list_recent(limit=limit, kind=kind)
+    })
+
+
+@app.route('/api/admin/profiles/<profile_id>')
+def get_profile(profile_id):
+    """API: 获取单条剖析记录"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    
+    profile = profiler.get(profile_id)
+    if not profile:
+        return jsonify({'error': '剖析记录不存在'}), 404
+    return jsonify(profile)
+
+
+@app.route('/api/image')
+def proxy_image():
+    """API: 封面图片代理（本地磁盘缓存，可选缩略图宽度 w）"""
+    url = request.args.get('url', '')
+    if not url:
+        return jsonify({'error': '缺少 url 参数'}), 400
+
+    width = request.args.get('w', type=int)
+
+    try:
+        path, etag, content_type = image_cache.get(url, width)
+    except ImageCacheError as e:
+        return jsonify({'error': str(e)}), e.status
+
+    # 缓存内容按哈希寻址，不会变化，可以长期缓存
+    response = send_file(path, mimetype=content_type, etag=etag, max_age=31536000)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    # 禁止浏览器嗅探类型或在本站源下执行内容
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Content-Security-Policy'] = "default-src 'none'; sandbox"
+    return response
+
+
 @app.route('/api/refresh', methods=['POST'])
 def refresh_data():
     """API: 触发后台数据刷新"""
@@ -420,7 +682,7 @@ def init_data():
         print("首次运行，正在获取初始数据...")
         print("=" * 60 + "\n")
         
-        fetcher = WorkflowFetcher(str(BASE_DIR))
+        fetcher = WorkflowFetcher(str(BASE_DIR), str(DATA_DIR))
         fetcher.run()
         
         print("\n初始数据获取完成！")
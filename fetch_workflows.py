@@ -13,23 +13,28 @@ from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any
 from dotenv import load_dotenv
+from profiler import profiler
 
 
 class WorkflowFetcher:
     """工作流数据采集器"""
     
-    def __init__(self, base_dir: str = None):
+    def __init__(self, base_dir: str = None, data_dir: str = None):
         """初始化采集器"""
-        self.base_url = "https://www.runninghub.cn/api/search/workflow"
         self.base_dir = Path(base_dir) if base_dir else Path(__file__).parent
-        self.data_dir = self.base_dir / "data"
-        self.data_dir.mkdir(exist_ok=True)
+        self.data_dir = Path(data_dir) if data_dir else self.base_dir / "data"
+        self.data_dir.mkdir(parents=True, exist_ok=True)
         
         # 加载环境变量
         env_path = self.base_dir / ".env"
         if env_path.exists():
             load_dotenv(env_path)
         
+        # API 地址（可通过 RUNNINGHUB_API_BASE 指向测试用的桩服务）
+        api_base = os.getenv("RUNNINGHUB_API_BASE", "https://www.runninghub.cn").rstrip("/")
+        self.base_url = f"{api_base}/api/search/workflow"
+        self.detail_url = f"{api_base}/api/workflow/copy"
+        
         # 从环境变量读取 authorization token
         auth_token = os.getenv("RUNNINGHUB_AUTH_TOKEN")
         if not auth_token:
@@ -71,7 +76,8 @@ class WorkflowFetcher:
         delay = base_delay + random.gauss(0, jitter / 2)
         # 确保延迟在合理范围内
         delay = max(0.5, min(delay, base_delay + jitter))
-        time.sleep(delay)
+        with profiler.stage('delay'):
+            time.sleep(delay)
     
     def fetch_page(self, page: int, size: int = 30, search: str = "换装") -> Dict[str, Any]:
         """
@@ -93,18 +99,53 @@ class WorkflowFetcher:
         }
         
         try:
-            response = requests.post(
-                self.base_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            return response.json()
+            with profiler.stage('upstream'):
+                response = requests.post(
+                    self.base_url,
+                    headers=self.headers,
+                    json=payload,
+                    timeout=30
+                )
+                response.raise_for_status()
+                return response.json()
         except requests.exceptions.RequestException as e:
             print(f"获取第 {page} 页时出错: {e}")
             return None
     
+    def fetch_workflow_detail(self, workflow_id: str) -> Dict[str, Any]:
+        """
+        获取单个工作流详情（包含 workflowContent）
+
+        参数:
+            workflow_id: 工作流ID
+
+        返回:
+            工作流详情字典，失败返回 None
+        """
+        payload = {
+            "workflowId": workflow_id,
+            "copyMode": 1
+        }
+
+        try:
+            with profiler.stage('upstream'):
+                response = requests.post(
+                    self.detail_url,
+                    headers=self.headers,
+                    json=payload,
+                    timeout=30
+                )
+                response.raise_for_status()
+                result = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"获取工作流 {workflow_id} 详情时出错: {e}")
+            return None
+
+        if result.get("code") != 0:
+            print(f"获取工作流 {workflow_id} 详情失败: {result.get('msg')}")
+            return None
+        return result.get("data") or None
+
     def fetch_all_workflows(self, search: str = "换装", size: int = 30, max_pages=None, callback=None) -> List[Dict[str, Any]]:
         """
         获取所有工作流数据（动态获取所有分页）
@@ -172,7 +213,8 @@ class WorkflowFetcher:
                 if callback:
                     callback(page, total_pages, f"第 {page} 页失败")
                 # 失败时额外延迟
-                time.sleep(random.uniform(3, 5))
+                with profiler.stage('delay'):
+                    time.sleep(random.uniform(3, 5))
         
         print(f"\n总共获取: {len(all_records)} 条记录")
         if callback:
@@ -196,7 +238,8 @@ class WorkflowFetcher:
             use_count = int(stats.get("useCount", 0))
             return (-collect_count, -like_count, -use_count)  # 负数实现降序
         
-        return sorted(workflows, key=sort_key)
+        with profiler.stage('sort'):
+            return sorted(workflows, key=sort_key)
     
     def save_data(self, workflows: List[Dict[str, Any]], search: str = "") -> str:
         """
@@ -228,8 +271,9 @@ class WorkflowFetcher:
         }
         
         # 保存到文件
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with profiler.stage('json_dump'):
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
         
         print(f"\n数据已保存到: {filepath}")
         return str(filepath)
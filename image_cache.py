@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+封面图片本地代理缓存
+按内容哈希存储原图，首次访问时生成卡片尺寸的缩略图
+"""
+
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装 Pillow 时只做原图缓存，不生成缩略图
+    Image = None
+
+
+class ImageCacheError(Exception):
+    """图片获取或处理失败"""
+
+    def __init__(self, message: str, status: int = 502):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageCache:
+    """封面图片磁盘缓存"""
+
+    # 允许的缩略图宽度（卡片宽度约 350px，800 用于高分屏）
+    VARIANT_WIDTHS = (200, 400, 800)
+    # 单张图片最大下载大小
+    MAX_IMAGE_BYTES = 20 * 1024 * 1024
+    # 最多跟随的重定向次数（每一跳都重新校验地址）
+    MAX_REDIRECTS = 3
+    # 分段锁数量（按 key 哈希取模，锁总数固定）
+    LOCK_STRIPES = 64
+    # 只代理位图格式（SVG 等可包含脚本的类型一律拒绝）
+    RASTER_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif', 'image/avif')
+    # 视频文件不经过图片代理
+    VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov')
+    # 默认只代理 RunningHub 的图片域名（含子域名）
+    DEFAULT_ALLOWED_HOSTS = ('runninghub.cn', 'runninghub.ai', 'rh-images.xiaoyaoyou.com')
+
+    def __init__(self, cache_dir: str, allowed_hosts: Optional[List[str]] = None):
+        """
+        初始化缓存
+
+        参数:
+            cache_dir: 缓存根目录
+            allowed_hosts: 允许代理的域名（含子域名），为空时使用 DEFAULT_ALLOWED_HOSTS
+        """
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / "blobs"
+        self.variant_dir = self.cache_dir / "variants"
+        self.url_dir = self.cache_dir / "urls"
+        for d in (self.blob_dir, self.variant_dir, self.url_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+        self.allowed_hosts = [h.strip().lower() for h in (allowed_hosts or []) if h.strip()]
+        if not self.allowed_hosts:
+            self.allowed_hosts = list(self.DEFAULT_ALLOWED_HOSTS)
+        self.headers = {
+            "accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+            "referer": "https://www.runninghub.cn/",
+        }
+
+        # 同一 URL 并发请求时只下载一次
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @staticmethod
+    def _sha256(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        # 不同 key 可能共用一把锁，调用方不能嵌套持有两把锁
+        return self._locks[hash(key) % self.LOCK_STRIPES]
+
+    @staticmethod
+    def _atomic_write(path: Path, data: bytes):
+        """先写临时文件再替换，避免读到写了一半的文件"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+
+    def _variant_path(self, digest: str, width: int) -> Path:
+        return self.variant_dir / digest[:2] / f"{digest}_w{width}.jpg"
+
+    def _url_entry_path(self, url: str) -> Path:
+        url_hash = self._sha256(url.encode('utf-8'))
+        return self.url_dir / url_hash[:2] / f"{url_hash}.json"
+
+    def _host_allowed(self, url: str) -> bool:
+        """检查协议、扩展名和域名白名单（不做 DNS 解析）"""
+        try:
+            parsed = urlparse(url)
+        except ValueError:
+            return False
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            return False
+        if parsed.path.lower().endswith(self.VIDEO_EXTENSIONS):
+            return False
+        host = parsed.hostname.lower()
+        return any(host == h or host.endswith('.' + h) for h in self.allowed_hosts)
+
+    def is_allowed(self, url: str) -> bool:
+        """检查 URL 是否可以代理（域名在白名单内，且解析到公网地址）"""
+        if not self._host_allowed(url):
+            return False
+        parsed = urlparse(url)
+        try:
+            port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        except ValueError:
+            return False
+        return self._resolves_to_public(parsed.hostname.lower(), port)
+
+    @staticmethod
+    def _resolves_to_public(host: str, port: int) -> bool:
+        """域名解析后的所有地址都必须是公网地址（拒绝回环、内网、链路本地等）"""
+        try:
+            infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError):
+            return False
+        if not infos:
+            return False
+        for info in infos:
+            try:
+                addr = ipaddress.ip_address(info[4][0].split('%', 1)[0])
+            except ValueError:
+                return False
+            if not addr.is_global or addr.is_multicast:
+                return False
+        return True
+
+    def snap_width(self, width: Optional[int]) -> Optional[int]:
+        """将请求宽度归一到允许的尺寸，避免生成任意尺寸的缓存文件"""
+        if not width:
+            return None
+        for w in self.VARIANT_WIDTHS:
+            if width <= w:
+                return w
+        return self.VARIANT_WIDTHS[-1]
+
+    def _download(self, url: str) -> Tuple[bytes, str]:
+        """下载原图（手动跟随重定向，每一跳都检查是否允许代理）"""
+        try:
+            for _ in range(self.MAX_REDIRECTS + 1):
+                if not self.is_allowed(url):
+                    raise ImageCacheError("不允许代理该地址", status=400)
+                response = requests.get(url, headers=self.headers, timeout=15,
+                                        stream=True, allow_redirects=False)
+                if not response.is_redirect:
+                    break
+                location = response.headers.get('location', '')
+                response.close()
+                url = urljoin(url, location)
+            else:
+                raise ImageCacheError("重定向次数过多")
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise ImageCacheError(f"下载图片失败: {e}")
+
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type == 'image/jpg':
+            content_type = 'image/jpeg'
+        if content_type not in self.RASTER_TYPES:
+            response.close()
+            raise ImageCacheError(f"不支持的图片类型: {content_type or '未知'}", status=415)
+
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > self.MAX_IMAGE_BYTES:
+                response.close()
+                raise ImageCacheError("图片过大", status=413)
+            chunks.append(chunk)
+        return b''.join(chunks), content_type
+
+    def _read_entry(self, entry_path: Path) -> Optional[Tuple[Path, str, str]]:
+        """读取 URL 缓存记录，原图存在时返回 (文件路径, 内容哈希, content-type)"""
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            blob_path = self._blob_path(entry['sha256'])
+            # 旧版本缓存的非位图类型视为未命中
+            if blob_path.exists() and entry['content_type'] in self.RASTER_TYPES:
+                return blob_path, entry['sha256'], entry['content_type']
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def get_original(self, url: str) -> Tuple[Path, str, str]:
+        """
+        获取原图（不存在时下载并缓存）
+
+        返回:
+            (文件路径, 内容哈希, content-type)
+        """
+        if not self._host_allowed(url):
+            raise ImageCacheError("不允许代理该地址", status=400)
+
+        entry_path = self._url_entry_path(url)
+        # 缓存命中不加锁，避免被同一分段锁上正在进行的下载阻塞
+        cached = self._read_entry(entry_path)
+        if cached:
+            return cached
+
+        with self._lock_for(entry_path.name):
+            # 拿到锁后再检查一次，可能已被其他线程下载
+            cached = self._read_entry(entry_path)
+            if cached:
+                return cached
+
+            # 只有真正下载时才解析域名，缓存命中不产生 DNS 查询
+            data, content_type = self._download(url)
+            digest = self._sha256(data)
+            blob_path = self._blob_path(digest)
+            # 内容相同的图片只存一份
+            if not blob_path.exists():
+                self._atomic_write(blob_path, data)
+
+            entry = {"url": url, "sha256": digest, "content_type": content_type}
+            self._atomic_write(entry_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+            return blob_path, digest, content_type
+
+    def _make_variant(self, blob_path: Path, digest: str, width: int) -> Optional[Path]:
+        """生成指定宽度的 JPEG 缩略图，无法处理时返回 None"""
+        variant_path = self._variant_path(digest, width)
+        if variant_path.exists():
+            return variant_path
+        if Image is None:
+            return None
+
+        with self._lock_for(variant_path.name):
+            if variant_path.exists():
+                return variant_path
+            try:
+                with Image.open(blob_path) as img:
+                    # 动图只取第一帧
+                    img.seek(0)
+                    if img.width <= width:
+                        return None
+                    height = max(1, round(img.height * width / img.width))
+                    if img.mode not in ('RGB', 'L'):
+                        img = img.convert('RGBA')
+                        background = Image.new('RGB', img.size, (255, 255, 255))
+                        background.paste(img, mask=img.split()[-1])
+                        img = background
+                    resized = img.resize((width, height), Image.LANCZOS)
+                    buffer = io.BytesIO()
+                    resized.save(buffer, format='JPEG', quality=82, optimize=True, progressive=True)
+            except Exception as e:
+                print(f"生成缩略图失败 {blob_path.name}: {e}")
+                return None
+
+            self._atomic_write(variant_path, buffer.getvalue())
+            return variant_path
+
+    def get(self, url: str, width: Optional[int] = None) -> Tuple[Path, str, str]:
+        """
+        获取图片（可选缩略图）
+
+        参数:
+            url: 原图地址
+            width: 期望宽度（None 表示原图）
+
+        返回:
+            (文件路径, ETag, content-type)
+        """
+        blob_path, digest, content_type = self.get_original(url)
+        width = self.snap_width(width)
+        if width:
+            variant_path = self._make_variant(blob_path, digest, width)
+            if variant_path:
+                return variant_path, f"{digest}-w{width}", 'image/jpeg'
+        return blob_path, digest, content_type
+
+    @classmethod
+    def cover_urls(cls, workflow: Dict[str, Any]) -> List[str]:
+        """提取卡片上会显示的图片地址（图片封面或视频的 thumbnailUri）"""
+        preview = (workflow.get("covers") or [{}])[0] or {}
+        url = preview.get("url") or ""
+        if url.lower().endswith(cls.VIDEO_EXTENSIONS):
+            url = preview.get("thumbnailUri") or ""
+        return [url] if url else []
+
+    def prefetch_snapshot(self, filepath: str, limit: int = 60, width: int = 400, max_workers: int = 4) -> int:
+        """
+        预取快照中排名靠前的工作流封面
+
+        参数:
+            filepath: 快照 JSON 文件路径
+            limit: 预取的工作流数量
+            width: 预生成的缩略图宽度
+            max_workers: 并发下载数
+
+        返回:
+            成功缓存的图片数量
+        """
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"读取快照失败，跳过封面预取: {e}")
+            return 0
+
+        urls = []
+        for workflow in data.get("workflows", [])[:limit]:
+            urls.extend(u for u in self.cover_urls(workflow) if self._host_allowed(u))
+
+        def fetch_one(url):
+            try:
+                self.get(url, width)
+                return True
+            except ImageCacheError as e:
+                print(f"预取封面失败 {url}: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            done = sum(pool.map(fetch_one, urls))
+
+        print(f"封面预取完成: {done}/{len(urls)}")
+        return done
@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+RunningHub 工作流浏览器压测工具
+生成合成快照数据，启动本地实例和桩上游服务，按真实流量比例回放请求
+并统计吞吐量、延迟分位数和服务器内存占用
+
+用法:
+    python loadtest.py --workflows 2000 --keywords 5 --concurrency 16 --duration 30
+    python loadtest.py --output results/run1.json
+    python loadtest.py --target http://127.0.0.1:5500 --server-pid 12345
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from urllib.parse import quote
+
+import requests
+
+BASE_DIR = Path(__file__).parent
+
+# 默认流量比例（权重）
+DEFAULT_MIX = {
+    'search': 50,
+    'searches': 15,
+    'files': 15,
+    'refresh_status': 10,
+    'workflow': 10,
+}
+
+# 合成数据使用的关键词，前几个与真实使用场景一致
+KEYWORD_POOL = ['换装', '风格化', '人物', 'all', 'flux', 'sdxl', 'video', 'upscale']
+
+NODE_TYPES = [
+    'KSampler', 'CheckpointLoaderSimple', 'CLIPTextEncode', 'VAEDecode', 'SaveImage',
+    'LoadImage', 'LoraLoader', 'IPAdapterAdvanced', 'ControlNetApply', 'UpscaleModelLoader',
+]
+
+
+def free_port() -> int:
+    """获取一个空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_workflow(rng: random.Random, index: int) -> Dict[str, Any]:
+    """生成一条与 RunningHub 搜索结果结构相近的工作流记录"""
+    workflow_id = str(1900000000000000000 + rng.randrange(10 ** 15))
+    is_video = rng.random() < 0.2
+    cover_url = f"https://rh-images.example.com/covers/{workflow_id}.{'mp4' if is_video else 'png'}"
+    return {
+        "id": workflow_id,
+        "name": f"合成工作流 {index} " + "".join(rng.choice("换装风格人物视频高清") for _ in range(8)),
+        "description": "合成描述 " * rng.randint(5, 40),
+        "covers": [{
+            "url": cover_url,
+            "thumbnailUri": f"https://rh-images.example.com/thumbs/{workflow_id}.jpg" if is_video else None,
+            "width": 1024,
+            "height": 1024,
+        }],
+        "tags": [{"id": str(rng.randrange(1000)), "name": rng.choice(KEYWORD_POOL)} for _ in range(rng.randint(1, 5))],
+        "owner": {"id": str(rng.randrange(10 ** 9)), "name": f"user{rng.randrange(10000)}"},
+        "statisticsInfo": {
+            "likeCount": str(rng.randint(0, 5000)),
+            "useCount": str(rng.randint(0, 100000)),
+            "collectCount": str(rng.randint(0, 3000)),
+        },
+        "createTime": (datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(500000))).isoformat(),
+    }
+
+
+def make_workflow_content(rng: random.Random, node_count: int = 40) -> str:
+    """生成 ComfyUI UI 格式的 workflowContent 字符串"""
+    nodes = []
+    for i in range(node_count):
+        node_type = rng.choice(NODE_TYPES)
+        widgets = [rng.randint(0, 2 ** 32), rng.randint(10, 50), 7.0]
+        if 'Loader' in node_type:
+            widgets.append(f"models/{node_type.lower()}_{rng.randrange(20)}.safetensors")
+        nodes.append({
+            "id": i + 1,
+            "type": node_type,
+            "pos": [rng.randint(0, 3000), rng.randint(0, 3000)],
+            "size": [315, 262],
+            "widgets_values": widgets,
+        })
+    links = [[i, i, 0, i + 1, 0, "LATENT"] for i in range(1, node_count)]
+    return json.dumps({"last_link_id": node_count, "nodes": nodes, "links": links,
+                       "groups": [], "config": {}, "version": 0.4})
+
+
+def seed_data(data_dir: Path, keywords: int, workflows: int, history: int, seed: int) -> Dict[str, List[str]]:
+    """
+    生成合成快照
+
+    参数:
+        data_dir: 数据目录
+        keywords: 关键词数量
+        workflows: 每个快照的工作流数量
+        history: 每个关键词的历史快照数量
+        seed: 随机种子
+
+    返回:
+        {关键词: [工作流ID, ...]}（取最新快照）
+    """
+    rng = random.Random(seed)
+    result = {}
+    names = KEYWORD_POOL[:keywords] + [f"kw{i}" for i in range(keywords - len(KEYWORD_POOL))]
+    now = datetime.now()
+
+    for keyword in names:
+        search_dir = data_dir / keyword
+        search_dir.mkdir(parents=True, exist_ok=True)
+        for h in range(history):
+            ts = now - timedelta(hours=history - h)
+            records = [make_workflow(rng, i) for i in range(workflows)]
+            filepath = search_dir / f"workflows_{ts.strftime('%Y%m%d%H%M')}.json"
+            data = {
+                "fetch_time": ts.isoformat(),
+                "total_count": len(records),
+                "search": "" if keyword == 'all' else keyword,
+                "workflows": records,
+            }
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            # 按修改时间排序，保证最后写入的是最新快照
+            os.utime(filepath, (ts.timestamp(), ts.timestamp()))
+        result[keyword] = [r["id"] for r in records]
+
+    return result
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    """模拟 RunningHub 上游接口"""
+
+    latency = 0.0
+    rng = random.Random(0)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            payload = {}
+        if self.latency:
+            time.sleep(self.latency)
+
+        if self.path.startswith('/api/workflow/copy'):
+            self._send_json({"code": 0, "msg": "success", "data": {
+                "workflowId": payload.get("workflowId"),
+                "name": f"合成工作流 {payload.get('workflowId')}",
+                "workflowContent": make_workflow_content(self.rng),
+            }})
+        elif self.path.startswith('/api/search/workflow'):
+            size = int(payload.get("size", 30))
+            self._send_json({"code": 0, "msg": "success", "data": {
+                "total": str(size * 10), "size": str(size), "pages": "10",
+                "current": str(payload.get("current", 1)),
+                "records": [make_workflow(self.rng, i) for i in range(size)],
+            }})
+        else:
+            self.send_error(404)
+
+
+def start_stub_upstream(latency: float) -> ThreadingHTTPServer:
+    """在后台线程启动桩上游服务"""
+    StubUpstreamHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), StubUpstreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(port: int, data_dir: Path, cache_dir: Path, upstream: str, log_path: Path) -> subprocess.Popen:
+    """以生产模式启动被测实例"""
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'HOST': '127.0.0.1',
+        'FLASK_ENV': 'production',
+        'DATA_DIR': str(data_dir),
+        'CACHE_DIR': str(cache_dir),
+        'PROFILE_DIR': str(cache_dir.parent / 'profiles'),
+        'RUNNINGHUB_API_BASE': upstream,
+        'RUNNINGHUB_AUTH_TOKEN': 'Bearer loadtest',
+        'IMAGE_PREFETCH_COUNT': '0',
+        'PYTHONUNBUFFERED': '1',
+    })
+    log_file = open(log_path, 'w', encoding='utf-8')
+    return subprocess.Popen(
+        [sys.executable, str(BASE_DIR / 'app.py')],
+        env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(target: str, timeout: float = 30.0):
+    """等待服务可用"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{target}/api/refresh/status", timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"服务在 {timeout} 秒内未就绪: {target}")
+
+
+def read_rss_kb(pid: int) -> Optional[int]:
+    """读取进程常驻内存（KB）"""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        out = subprocess.run(['ps', '-o', 'rss=', '-p', str(pid)], capture_output=True, text=True)
+        return int(out.stdout.strip()) if out.stdout.strip() else None
+    except (OSError, ValueError):
+        return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """解析 "search=50,files=10" 格式的流量比例"""
+    mix = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知的请求类型: {name}（可选 {', '.join(DEFAULT_MIX)}）")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def collect_target_keywords(target: str, with_ids: bool = False, max_ids: int = 200) -> Dict[str, List[str]]:
+    """
+    从已运行的实例收集关键词（以及可选的真实工作流ID）
+
+    参数:
+        target: 实例地址
+        with_ids: 是否通过 /api/search/<关键词> 收集工作流ID
+        max_ids: 每个关键词最多收集的ID数量
+
+    返回:
+        {关键词: [工作流ID, ...]}
+    """
+    keywords = {}
+    try:
+        for item in requests.get(f"{target}/api/searches", timeout=10).json():
+            keywords[item['keyword']] = []
+    except (requests.exceptions.RequestException, ValueError, KeyError, TypeError):
+        return keywords
+
+    if with_ids:
+        for keyword in keywords:
+            try:
+                response = requests.get(f"{target}/api/search/{quote(keyword)}", timeout=60)
+                if response.status_code != 200:
+                    continue
+                workflows = response.json().get('workflows', [])
+            except (requests.exceptions.RequestException, ValueError, AttributeError):
+                continue
+            keywords[keyword] = [str(w['id']) for w in workflows[:max_ids] if w.get('id')]
+    return keywords
+
+
+class LoadGenerator:
+    """按权重回放请求并记录延迟"""
+
+    def __init__(self, target: str, mix: Dict[str, int], keywords: Dict[str, List[str]], seed: int = 0):
+        self.target = target.rstrip('/')
+        self.mix = {k: v for k, v in mix.items() if v > 0}
+        self.keywords = keywords
+        self.workflow_ids = [i for ids in keywords.values() for i in ids]
+        # 没有真实工作流ID时不发 workflow 请求（随便编的ID会被实例转发到上游）
+        if 'workflow' in self.mix and not self.workflow_ids:
+            print("警告: 没有可用的工作流ID，已从流量比例中去掉 workflow")
+            del self.mix['workflow']
+        if not self.mix:
+            raise ValueError("流量比例为空")
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {k: [] for k in self.mix}
+        self.errors: Dict[str, int] = {k: 0 for k in self.mix}
+        self.bytes: Dict[str, int] = {k: 0 for k in self.mix}
+        # 各接口的状态码计数（"error" 表示连接失败或超时）
+        self.status_codes: Dict[str, Dict[str, int]] = {k: {} for k in self.mix}
+
+    def build_url(self, kind: str, rng: random.Random) -> str:
+        """根据请求类型构造 URL"""
+        keyword = rng.choice(list(self.keywords)) if self.keywords else 'all'
+        if kind == 'search':
+            return f"{self.target}/api/search/{quote(keyword)}"
+        if kind == 'searches':
+            return f"{self.target}/api/searches"
+        if kind == 'files':
+            return f"{self.target}/api/files"
+        if kind == 'refresh_status':
+            return f"{self.target}/api/refresh/status"
+        return f"{self.target}/api/workflow/{rng.choice(self.workflow_ids)}"
+
+    def worker(self, worker_id: int, stop_at: float, max_requests: Optional[int], counter: List[int]):
+        rng = random.Random(self.seed * 1000 + worker_id)
+        kinds = list(self.mix)
+        weights = [self.mix[k] for k in kinds]
+        session = requests.Session()
+        while time.time() < stop_at:
+            if max_requests is not None:
+                with self.lock:
+                    if counter[0] >= max_requests:
+                        return
+                    counter[0] += 1
+            kind = rng.choices(kinds, weights)[0]
+            url = self.build_url(kind, rng)
+            start = time.perf_counter()
+            try:
+                response = session.get(url, timeout=60)
+                size = len(response.content)
+                code = str(response.status_code)
+                # 只有 200 算成功（202 表示搜索尚未缓存，404 表示数据缺失，都不是正常的读路径）
+                ok = response.status_code == 200
+            except requests.exceptions.RequestException:
+                size = 0
+                code = 'error'
+                ok = False
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies[kind].append(elapsed)
+                self.bytes[kind] += size
+                codes = self.status_codes[kind]
+                codes[code] = codes.get(code, 0) + 1
+                if not ok:
+                    self.errors[kind] += 1
+
+    def run(self, concurrency: int, duration: float, max_requests: Optional[int] = None,
+            server_pid: Optional[int] = None) -> Dict[str, Any]:
+        """
+        执行压测
+
+        参数:
+            concurrency: 并发连接数
+            duration: 持续时间（秒）
+            max_requests: 最大请求数（None 表示只按时间）
+            server_pid: 被测进程 PID，用于采样内存
+
+        返回:
+            统计结果
+        """
+        rss_samples = []
+        stop_at = time.time() + duration
+        counter = [0]
+        threads = [threading.Thread(target=self.worker, args=(i, stop_at, max_requests, counter), daemon=True)
+                   for i in range(concurrency)]
+
+        rss_start = read_rss_kb(server_pid) if server_pid else None
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            if server_pid:
+                rss = read_rss_kb(server_pid)
+                if rss:
+                    rss_samples.append(rss)
+            time.sleep(0.5)
+        wall = time.perf_counter() - start
+
+        endpoints = {}
+        all_latencies = []
+        for kind, values in self.latencies.items():
+            values.sort()
+            all_latencies.extend(values)
+            endpoints[kind] = self._summarize(values, self.errors[kind], wall, self.bytes[kind])
+            endpoints[kind]["status_codes"] = dict(sorted(self.status_codes[kind].items()))
+        all_latencies.sort()
+
+        return {
+            "duration_s": round(wall, 3),
+            "concurrency": concurrency,
+            "mix": self.mix,
+            "overall": self._summarize(all_latencies, sum(self.errors.values()), wall, sum(self.bytes.values())),
+            "endpoints": endpoints,
+            "server_rss_kb": {
+                "start": rss_start,
+                "peak": max(rss_samples) if rss_samples else None,
+                "end": read_rss_kb(server_pid) if server_pid else None,
+            },
+        }
+
+    @staticmethod
+    def _summarize(values: List[float], errors: int, wall: float, total_bytes: int) -> Dict[str, Any]:
+        count = len(values)
+        return {
+            "requests": count,
+            "errors": errors,
+            "throughput_rps": round(count / wall, 2) if wall else 0.0,
+            "mean_ms": round(sum(values) / count * 1000, 2) if count else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if count else 0.0,
+            "bytes": total_bytes,
+        }
+
+
+def print_report(results: Dict[str, Any]):
+    """打印结果表格"""
+    print("\n" + "=" * 78)
+    print(f"压测结果（{results['duration_s']} 秒，并发 {results['concurrency']}）")
+    print("=" * 78)
+    print(f"{'接口':<16}{'请求数':>8}{'错误':>6}{'RPS':>9}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'平均KB':>10}")
+    print("-" * 78)
+    rows = list(results['endpoints'].items()) + [('总计', results['overall'])]
+    for name, s in rows:
+        avg_kb = s['bytes'] / s['requests'] / 1024 if s['requests'] else 0
+        print(f"{name:<16}{s['requests']:>8}{s['errors']:>6}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}{avg_kb:>10.1f}")
+    rss = results['server_rss_kb']
+    if rss['peak']:
+        print("-" * 78)
+        print(f"服务器 RSS: 开始 {rss['start'] / 1024:.1f} MB, "
+              f"峰值 {rss['peak'] / 1024:.1f} MB, 结束 {(rss['end'] or 0) / 1024:.1f} MB")
+    print("=" * 78)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RunningHub 工作流浏览器压测工具")
+    parser.add_argument('--workflows', type=int, default=1000, help="每个快照的工作流数量")
+    parser.add_argument('--keywords', type=int, default=4, help="关键词（子目录）数量")
+    parser.add_argument('--history', type=int, default=3, help="每个关键词的历史快照数量")
+    parser.add_argument('--concurrency', type=int, default=8, help="并发连接数")
+    parser.add_argument('--duration', type=float, default=20.0, help="持续时间（秒）")
+    parser.add_argument('--requests', type=int, default=None, help="最大请求数（达到即停止）")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="流量比例，如 search=50,searches=15,files=15,refresh_status=10,workflow=10")
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help="桩上游响应延迟（秒）")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--target', default=None, help="压测已运行的实例（不生成数据、不启动服务）")
+    parser.add_argument('--allow-upstream', action='store_true',
+                        help="配合 --target 时保留 workflow 请求（未缓存的工作流会由被测实例请求真实的 RunningHub 接口）")
+    parser.add_argument('--server-pid', type=int, default=None, help="配合 --target 采样内存的进程 PID")
+    parser.add_argument('--output', default=None, help="结果 JSON 输出路径")
+    parser.add_argument('--keep', action='store_true', help="保留生成的临时数据目录")
+    args = parser.parse_args()
+
+    workdir = None
+    app_proc = None
+    upstream = None
+    try:
+        if args.target:
+            target = args.target.rstrip('/')
+            keywords = collect_target_keywords(target, with_ids=args.allow_upstream)
+            if args.mix.get('workflow') and not args.allow_upstream:
+                print("提示: --target 模式默认不发 workflow 请求，以免把压测流量转发到 RunningHub；"
+                      "确需压测请加 --allow-upstream")
+                args.mix = {k: v for k, v in args.mix.items() if k != 'workflow'}
+            server_pid = args.server_pid
+        else:
+            workdir = Path(tempfile.mkdtemp(prefix='rh-loadtest-'))
+            print(f"生成合成数据: {args.keywords} 个关键词 x {args.history} 个快照 x {args.workflows} 条工作流")
+            keywords = seed_data(workdir / 'data', args.keywords, args.workflows, args.history, args.seed)
+
+            upstream = start_stub_upstream(args.upstream_latency)
+            upstream_url = f"http://127.0.0.1:{upstream.server_address[1]}"
+            port = free_port()
+            target = f"http://127.0.0.1:{port}"
+            print(f"启动被测实例: {target}（上游桩: {upstream_url}）")
+            app_proc = start_app(port, workdir / 'data', workdir / 'cache', upstream_url, workdir / 'app.log')
+            wait_ready(target)
+            server_pid = app_proc.pid
+
+        generator = LoadGenerator(target, args.mix, keywords, args.seed)
+        print(f"开始压测: 并发 {args.concurrency}, 持续 {args.duration} 秒")
+        results = generator.run(args.concurrency, args.duration, args.requests, server_pid)
+        results["config"] = {
+            "target": target,
+            "workflows": args.workflows,
+            "keywords": args.keywords,
+            "history": args.history,
+            "upstream_latency_s": args.upstream_latency,
+            "seed": args.seed,
+            "external_target": bool(args.target),
+        }
+        results["timestamp"] = datetime.now().isoformat()
+
+        print_report(results)
+
+        if args.output:
+            output = Path(args.output)
+            output.parent.mkdir(parents=True, exist_ok=True)
+            with open(output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存到: {output}")
+    finally:
+        if app_proc:
+            app_proc.terminate()
+            try:
+                app_proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                app_proc.kill()
+        if upstream:
+            upstream.shutdown()
+        if workdir:
+            if args.keep:
+                print(f"临时数据保留在: {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
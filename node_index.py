@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+ComfyUI 节点类型索引
+批量获取并缓存工作流内容，建立 节点类型 / 模型文件 -> 工作流ID 的倒排索引
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set
+
+from fetch_workflows import WorkflowFetcher
+from profiler import profiler
+
+
+# 视为模型文件的扩展名
+MODEL_EXTENSIONS = (
+    '.safetensors', '.ckpt', '.pt', '.pth', '.bin', '.gguf', '.onnx', '.sft'
+)
+
+
+def _iter_strings(value):
+    """递归遍历参数中的所有字符串"""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _iter_strings(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _iter_strings(v)
+
+
+def _model_names(values) -> Set[str]:
+    """从节点参数中提取模型文件名（去掉子目录）"""
+    models = set()
+    for s in _iter_strings(values):
+        name = s.strip().replace('\\', '/').rsplit('/', 1)[-1]
+        if name.lower().endswith(MODEL_EXTENSIONS):
+            models.add(name)
+    return models
+
+
+def parse_workflow_graph(content) -> Dict[str, List[str]]:
+    """
+    解析 workflowContent，提取节点类型和模型文件名
+
+    同时支持 UI 格式（nodes 数组，含 subgraph 定义）和 API 格式（{id: {class_type, inputs}}）
+
+    参数:
+        content: workflowContent（JSON 字符串或已解析的字典）
+
+    返回:
+        {"node_types": [...], "models": [...]}
+    """
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            content = None
+    if not isinstance(content, dict):
+        return {"node_types": [], "models": []}
+
+    node_types = set()
+    models = set()
+
+    def visit_ui_nodes(nodes):
+        for node in nodes or []:
+            if not isinstance(node, dict):
+                continue
+            node_type = node.get("type")
+            if isinstance(node_type, str) and node_type:
+                node_types.add(node_type)
+            models.update(_model_names(node.get("widgets_values")))
+
+    if isinstance(content.get("nodes"), list):
+        visit_ui_nodes(content["nodes"])
+        definitions = content.get("definitions") or {}
+        for subgraph in definitions.get("subgraphs") or []:
+            if isinstance(subgraph, dict):
+                visit_ui_nodes(subgraph.get("nodes"))
+    else:
+        for node in content.values():
+            if isinstance(node, dict) and isinstance(node.get("class_type"), str):
+                node_types.add(node["class_type"])
+                models.update(_model_names(node.get("inputs")))
+
+    return {"node_types": sorted(node_types), "models": sorted(models)}
+
+
+class NodeIndex:
+    """工作流节点倒排索引"""
+
+    def __init__(self, base_dir: str, cache_dir: str = None, data_dir: str = None, max_workers: int = 4):
+        """
+        初始化索引
+
+        参数:
+            base_dir: 项目根目录
+            cache_dir: 缓存目录（默认 base_dir/cache）
+            data_dir: 数据目录（传给采集器，默认 base_dir/data）
+            max_workers: 批量获取工作流内容时的并发数
+        """
+        self.base_dir = Path(base_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else self.base_dir / "cache"
+        self.data_dir = data_dir
+        self.content_dir = self.cache_dir / "workflows"
+        self.index_file = self.cache_dir / "node_index.json"
+        self.content_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+
+        self._lock = threading.Lock()
+        # 延迟保存的定时器（合并短时间内的多次写入）
+        self._save_timer: Optional[threading.Timer] = None
+        # workflow_id -> {"name", "node_types", "models"}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.by_node_type: Dict[str, Set[str]] = {}
+        self.by_model: Dict[str, Set[str]] = {}
+        # 小写 -> 原始名称集合，用于大小写不敏感查询（只差大小写的名称共用一个键）
+        self._node_type_names: Dict[str, Set[str]] = {}
+        self._model_names: Dict[str, Set[str]] = {}
+
+        self.status = {
+            'is_running': False,
+            'current': 0,
+            'total': 0,
+            'message': '',
+            'error': None
+        }
+
+        self.load()
+
+    def _content_path(self, workflow_id: str) -> Path:
+        return self.content_dir / workflow_id[:2] / f"{workflow_id}.json"
+
+    def load(self):
+        """从磁盘加载已保存的索引"""
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"加载节点索引失败: {e}")
+            return
+        with self._lock:
+            for workflow_id, entry in entries.items():
+                self._add_entry(workflow_id, entry)
+
+    def save(self):
+        """保存索引到磁盘"""
+        with self._lock:
+            data = json.dumps(self.entries, ensure_ascii=False)
+        tmp_path = self.index_file.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_file)
+
+    def schedule_save(self, delay: float = 10.0):
+        """延迟保存索引，delay 秒内的多次调用只保存一次"""
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(delay, self._run_scheduled_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _run_scheduled_save(self):
+        with self._lock:
+            self._save_timer = None
+        try:
+            self.save()
+        except OSError as e:
+            print(f"保存节点索引失败: {e}")
+
+    def _add_entry(self, workflow_id: str, entry: Dict[str, Any]):
+        """加入倒排索引（调用方需持有锁）"""
+        self._remove_entry(workflow_id)
+        self.entries[workflow_id] = entry
+        for node_type in entry.get("node_types", []):
+            self.by_node_type.setdefault(node_type, set()).add(workflow_id)
+            self._node_type_names.setdefault(node_type.lower(), set()).add(node_type)
+        for model in entry.get("models", []):
+            self.by_model.setdefault(model, set()).add(workflow_id)
+            self._model_names.setdefault(model.lower(), set()).add(model)
+
+    def _remove_entry(self, workflow_id: str):
+        """从倒排索引中移除（调用方需持有锁）"""
+        old = self.entries.pop(workflow_id, None)
+        if not old:
+            return
+        for key, index, names in (("node_types", self.by_node_type, self._node_type_names),
+                                  ("models", self.by_model, self._model_names)):
+            for name in old.get(key, []):
+                ids = index.get(name)
+                if ids:
+                    ids.discard(workflow_id)
+                    if not ids:
+                        del index[name]
+                        # 只移除这一个写法，其他大小写写法仍保留
+                        variants = names.get(name.lower())
+                        if variants:
+                            variants.discard(name)
+                            if not variants:
+                                del names[name.lower()]
+
+    def get_cached_detail(self, workflow_id: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的工作流详情
+
+        参数:
+            workflow_id: 工作流ID
+            max_age: 最长缓存时间（秒），超过视为未缓存；None 表示不限
+        """
+        path = self._content_path(workflow_id)
+        try:
+            if max_age is not None and time.time() - path.stat().st_mtime > max_age:
+                return None
+        except OSError:
+            return None
+        try:
+            with profiler.stage('file_io'):
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            with profiler.stage('json_load'):
+                return json.loads(text)
+        except (OSError, ValueError):
+            return None
+
+    def store_detail(self, workflow_id: str, detail: Dict[str, Any], name: str = ""):
+        """
+        缓存工作流详情并解析加入索引
+
+        参数:
+            workflow_id: 工作流ID
+            detail: /api/workflow/copy 返回的 data
+            name: 工作流名称（详情中没有时使用）
+        """
+        path = self._content_path(workflow_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(detail, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        entry = parse_workflow_graph(detail.get("workflowContent"))
+        entry["name"] = detail.get("name") or name
+        with self._lock:
+            self._add_entry(workflow_id, entry)
+
+    def build_from_snapshot(self, filepath: str, refresh: bool = False):
+        """
+        为快照中的所有工作流建立索引（已缓存的直接解析，其余并发获取）
+
+        参数:
+            filepath: 快照 JSON 文件路径
+            refresh: 是否重新获取已缓存的工作流
+        """
+        status = self.status
+        try:
+            status['is_running'] = True
+            status['current'] = 0
+            status['total'] = 0
+            status['message'] = '开始建立节点索引...'
+            status['error'] = None
+
+            with open(filepath, 'r', encoding='utf-8') as f:
+                workflows = json.load(f).get("workflows", [])
+
+            todo = []
+            for workflow in workflows:
+                workflow_id = str(workflow.get("id", ""))
+                if not workflow_id:
+                    continue
+                if not refresh and workflow_id in self.entries:
+                    continue
+                cached = None if refresh else self.get_cached_detail(workflow_id)
+                if cached:
+                    self.store_detail(workflow_id, cached, workflow.get("name", ""))
+                else:
+                    todo.append((workflow_id, workflow.get("name", "")))
+
+            status['total'] = len(todo)
+            status['message'] = f'需要获取 {len(todo)} 个工作流内容'
+            fetcher = WorkflowFetcher(str(self.base_dir), self.data_dir)
+            progress_lock = threading.Lock()
+            failed = []
+
+            def fetch_one(item):
+                workflow_id, name = item
+                # 与分页抓取一样模拟真人间隔，避免被上游限流（每个线程各自间隔）
+                fetcher.human_delay(random.uniform(1.5, 3.0), random.uniform(0.3, 1.0))
+                detail = fetcher.fetch_workflow_detail(workflow_id)
+                if detail:
+                    self.store_detail(workflow_id, detail, name)
+                else:
+                    failed.append(workflow_id)
+                    # 失败时额外延迟
+                    time.sleep(random.uniform(3, 5))
+                with progress_lock:
+                    status['current'] += 1
+                    status['message'] = f"已获取 {status['current']}/{status['total']} 个工作流"
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                list(pool.map(fetch_one, todo))
+
+            self.save()
+            status['message'] = f'节点索引完成！共 {len(self.entries)} 个工作流'
+            if failed:
+                status['message'] += f'，{len(failed)} 个获取失败'
+        except Exception as e:
+            status['error'] = f'建立索引出错: {str(e)}'
+            print(f"建立节点索引出错: {e}")
+        finally:
+            status['is_running'] = False
+
+    def _lookup(self, index: Dict[str, Set[str]], names: Dict[str, Set[str]], key: str) -> Dict[str, Any]:
+        """大小写不敏感查询，合并所有只差大小写的名称对应的工作流"""
+        with self._lock:
+            variants = names.get(key.lower(), set())
+            if key in index or not variants:
+                name = key
+            else:
+                # 只有一种写法时返回原始名称
+                name = next(iter(variants)) if len(variants) == 1 else key
+            ids = sorted(set().union(*(index.get(v, ()) for v in variants)))
+            workflows = [{'id': i, 'name': self.entries[i].get("name", "")} for i in ids]
+        return {'name': name, 'count': len(workflows), 'workflows': workflows}
+
+    def find_by_node_type(self, class_type: str) -> Dict[str, Any]:
+        """查询使用某节点类型的工作流"""
+        return self._lookup(self.by_node_type, self._node_type_names, class_type)
+
+    def find_by_model(self, filename: str) -> Dict[str, Any]:
+        """查询使用某模型文件的工作流"""
+        return self._lookup(self.by_model, self._model_names, filename)
+
+    def summary(self, kind: str = "node_types") -> List[Dict[str, Any]]:
+        """列出所有节点类型（或模型文件）及其工作流数量，按数量降序"""
+        index = self.by_model if kind == "models" else self.by_node_type
+        with self._lock:
+            items = [{'name': k, 'count': len(v)} for k, v in index.items()]
+        items.sort(key=lambda x: (-x['count'], x['name']))
+        return items
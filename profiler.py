@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+按需性能剖析
+对抽样的请求或单次抓取任务记录各阶段耗时（文件读取、json 解析、jsonify、排序、上游请求等），
+结果保存到 logs/ 目录，供管理接口查询热点
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Profile.id 的格式（uuid4 十六进制前 12 位）
+PROFILE_ID_RE = re.compile(r'^[0-9a-f]{12}$')
+
+
+class Profile:
+    """单次请求或抓取任务的剖析记录"""
+
+    def __init__(self, kind: str, name: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.name = name
+        self.started_at = datetime.now()
+        self._t0 = time.perf_counter()
+        # 阶段名 -> {"count", "total_ms", "max_ms"}
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.extra: Dict[str, Any] = {}
+
+    def add(self, stage: str, elapsed: float):
+        ms = elapsed * 1000
+        s = self.stages.get(stage)
+        if s is None:
+            self.stages[stage] = {"count": 1, "total_ms": ms, "max_ms": ms}
+        else:
+            s["count"] += 1
+            s["total_ms"] += ms
+            s["max_ms"] = max(s["max_ms"], ms)
+
+    def finish(self) -> Dict[str, Any]:
+        total_ms = (time.perf_counter() - self._t0) * 1000
+        stages = {
+            name: {k: round(v, 3) for k, v in s.items()}
+            for name, s in sorted(self.stages.items(), key=lambda x: -x[1]["total_ms"])
+        }
+        # 未被任何阶段覆盖的时间（路由分发、Python 逻辑等）
+        covered = sum(s["total_ms"] for s in self.stages.values())
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round(total_ms, 3),
+            "other_ms": round(max(0.0, total_ms - covered), 3),
+            "stages": stages,
+            **self.extra,
+        }
+
+
+class _Stage:
+    """计时上下文"""
+
+    __slots__ = ('profile', 'name', 't0')
+
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.add(self.name, time.perf_counter() - self.t0)
+        return False
+
+
+class _NullStage:
+    """未开启剖析时的空上下文"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """剖析开关与结果存储（运行时可调整，无需重启）"""
+
+    def __init__(self, log_dir: str = None, sample_rate: float = 0.0, max_recent: int = 200):
+        """
+        初始化
+
+        参数:
+            log_dir: 剖析结果保存目录（None 表示不落盘）
+            sample_rate: 请求抽样比例（0~1）
+            max_recent: 内存和磁盘上保留的最近记录数
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.sample_rate = sample_rate
+        # 剩余需要剖析的抓取任务次数
+        self.pending_crawls = 0
+        self.recent = deque(maxlen=max_recent)
+        self.log_dir = None
+        if log_dir:
+            self.set_log_dir(log_dir)
+
+    def set_log_dir(self, log_dir: str):
+        """设置保存目录，并加载目录中已有的最近记录"""
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.log_dir.glob("*.json"))[-self.recent.maxlen:]
+        loaded = []
+        for path in files:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        with self._lock:
+            self.recent.extend(loaded)
+
+    def configure(self, sample_rate: Optional[float] = None, profile_next_crawl: Optional[int] = None):
+        """
+        调整剖析配置
+
+        参数:
+            sample_rate: 请求抽样比例（0~1）
+            profile_next_crawl: 接下来需要剖析的抓取任务次数
+        """
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+            if profile_next_crawl is not None:
+                self.pending_crawls = max(0, int(profile_next_crawl))
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            "sample_rate": self.sample_rate,
+            "pending_crawls": self.pending_crawls,
+            "log_dir": str(self.log_dir) if self.log_dir else None,
+            "recent_count": len(self.recent),
+        }
+
+    def should_sample(self) -> bool:
+        """按抽样比例决定是否剖析本次请求"""
+        rate = self.sample_rate
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def take_crawl(self) -> bool:
+        """是否剖析本次抓取任务（消耗一次计数）"""
+        with self._lock:
+            if self.pending_crawls > 0:
+                self.pending_crawls -= 1
+                return True
+            return False
+
+    @property
+    def active(self) -> bool:
+        return getattr(self._local, 'profile', None) is not None
+
+    def start(self, kind: str, name: str) -> Profile:
+        """在当前线程开始剖析"""
+        profile = Profile(kind, name)
+        self._local.profile = profile
+        return profile
+
+    def annotate(self, **extra):
+        """为当前剖析记录附加信息"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.extra.update(extra)
+
+    def stage(self, name: str):
+        """
+        阶段计时上下文，当前线程未开启剖析时几乎没有开销
+
+        用法:
+            with profiler.stage('json_load'):
+                data = json.loads(text)
+        """
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return _NULL_STAGE
+        return _Stage(profile, name)
+
+    def finish(self, **extra) -> Optional[Dict[str, Any]]:
+        """结束当前线程的剖析，保存并返回结果"""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return None
+        self._local.profile = None
+        profile.extra.update(extra)
+        result = profile.finish()
+
+        with self._lock:
+            self.recent.append(result)
+        if self.log_dir:
+            # 时间精确到微秒，同一秒内的多条记录按名称排序也能保持先后顺序
+            filename = f"{profile.started_at.strftime('%Y%m%d%H%M%S%f')}_{profile.kind}_{profile.id}.json"
+            try:
+                with open(self.log_dir / filename, 'w', encoding='utf-8') as f:
+                    json.dump(result, f, ensure_ascii=False, indent=2)
+            except OSError as e:
+                print(f"保存剖析结果失败: {e}")
+            self._prune_log_dir()
+        return result
+
+    def _prune_log_dir(self):
+        """磁盘上只保留最近 max_recent 个剖析文件（文件名以微秒级时间开头，按名称排序即按时间排序）"""
+        with self._lock:
+            try:
+                files = sorted(self.log_dir.glob("*.json"))
+                for path in files[:-self.recent.maxlen]:
+                    path.unlink()
+            except OSError as e:
+                print(f"清理剖析文件失败: {e}")
+
+    def list_recent(self, limit: int = 20, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的剖析记录（最新的在前）"""
+        with self._lock:
+            items = list(self.recent)
+        if kind:
+            items = [p for p in items if p.get("kind") == kind]
+        return list(reversed(items))[:limit]
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """按 ID 获取剖析记录"""
+        # ID 会拼进 glob 模式，只接受 Profile 生成的 12 位十六进制
+        if not PROFILE_ID_RE.match(profile_id or ''):
+            return None
+        with self._lock:
+            for p in self.recent:
+                if p.get("id") == profile_id:
+                    return p
+        if self.log_dir:
+            for path in self.log_dir.glob(f"*_{profile_id}.json"):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return None
+
+    def hotspots(self, limit: int = 10, kind: Optional[str] = None) -> Dict[str, Any]:
+        """
+        汇总最近记录中的耗时热点
+
+        返回:
+            stages: 各阶段累计耗时（按 kind 区分，含未覆盖的 other），按总耗时降序
+            slowest: 总耗时最长的记录
+        """
+        with self._lock:
+            items = list(self.recent)
+        if kind:
+            items = [p for p in items if p.get("kind") == kind]
+
+        grand_total = sum(p.get("total_ms", 0) for p in items) or 1.0
+        stages: Dict[tuple, Dict[str, float]] = {}
+        for p in items:
+            rows = list(p.get("stages", {}).items())
+            rows.append(("other", {"count": 1, "total_ms": p.get("other_ms", 0), "max_ms": p.get("other_ms", 0)}))
+            for name, s in rows:
+                key = (p.get("kind"), name)
+                agg = stages.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                agg["count"] += s.get("count", 0)
+                agg["total_ms"] += s.get("total_ms", 0)
+                agg["max_ms"] = max(agg["max_ms"], s.get("max_ms", 0))
+
+        stage_list = [{
+            "kind": k,
+            "stage": name,
+            "count": int(agg["count"]),
+            "total_ms": round(agg["total_ms"], 3),
+            "max_ms": round(agg["max_ms"], 3),
+            "share": round(agg["total_ms"] / grand_total, 4),
+        } for (k, name), agg in stages.items()]
+        stage_list.sort(key=lambda x: -x["total_ms"])
+
+        slowest = sorted(items, key=lambda p: -p.get("total_ms", 0))[:limit]
+        return {
+            "profiles": len(items),
+            "stages": stage_list[:limit],
+            "slowest": [{k: p.get(k) for k in ("id", "kind", "name", "started_at", "total_ms")} for p in slowest],
+        }
+
+
+# 全局实例（app.py 启动时设置保存目录和抽样比例）
+profiler = Profiler()
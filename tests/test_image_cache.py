@@ -0,0 +1,150 @@
+import socket
+
+import pytest
+
+from image_cache import ImageCache, ImageCacheError
+
+
+def fake_getaddrinfo(mapping):
+    """按域名返回指定地址的 getaddrinfo 替身"""
+    def getaddrinfo(host, port, *args, **kwargs):
+        if host not in mapping:
+            raise socket.gaierror(host)
+        family = socket.AF_INET6 if ':' in mapping[host] else socket.AF_INET
+        return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (mapping[host], port))]
+    return getaddrinfo
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(socket, 'getaddrinfo', fake_getaddrinfo({
+        'rh-images.xiaoyaoyou.com': '8.8.4.4',
+        'img.runninghub.cn': '8.8.8.8',
+        'evil.runninghub.cn': '127.0.0.1',
+        'meta.runninghub.cn': '169.254.169.254',
+        'lan.runninghub.cn': '10.0.0.5',
+        'v6.runninghub.cn': '::1',
+    }))
+    return ImageCache(str(tmp_path))
+
+
+def test_empty_allowlist_uses_defaults(tmp_path):
+    assert ImageCache(str(tmp_path), allowed_hosts=['']).allowed_hosts == list(ImageCache.DEFAULT_ALLOWED_HOSTS)
+
+
+def test_rejects_loopback_and_metadata_addresses(cache):
+    assert not cache.is_allowed('http://169.254.169.254/latest/meta-data')
+    assert not cache.is_allowed('http://127.0.0.1:5500/a.png')
+    assert not cache.is_allowed('http://localhost/a.png')
+
+
+def test_rejects_allowed_host_resolving_to_private_address(cache):
+    assert not cache.is_allowed('https://evil.runninghub.cn/a.png')
+    assert not cache.is_allowed('https://meta.runninghub.cn/a.png')
+    assert not cache.is_allowed('https://lan.runninghub.cn/a.png')
+    assert not cache.is_allowed('https://v6.runninghub.cn/a.png')
+
+
+def test_allows_public_runninghub_hosts(cache):
+    assert cache.is_allowed('https://img.runninghub.cn/covers/a.png')
+    assert not cache.is_allowed('https://img.runninghub.cn/covers/a.mp4')
+    assert not cache.is_allowed('ftp://img.runninghub.cn/a.png')
+    assert not cache.is_allowed('https://runninghub.cn.example.com/a.png')
+
+
+def test_get_original_rejects_before_download(cache, monkeypatch):
+    monkeypatch.setattr('image_cache.requests.get', lambda url, **kwargs: pytest.fail("不应发起下载"))
+    with pytest.raises(ImageCacheError) as e:
+        cache.get_original('http://169.254.169.254/latest/meta-data')
+    assert e.value.status == 400
+    with pytest.raises(ImageCacheError):
+        cache.get_original('https://evil.runninghub.cn/a.png')
+
+
+def test_snap_width(cache):
+    assert cache.snap_width(None) is None
+    assert cache.snap_width(0) is None
+    assert cache.snap_width(150) == 200
+    assert cache.snap_width(400) == 400
+    assert cache.snap_width(401) == 800
+    assert cache.snap_width(5000) == 800
+
+
+class FakeResponse:
+    def __init__(self, status, location=None, body=b'', content_type='image/png'):
+        self.status_code = status
+        self.headers = {'content-type': content_type}
+        if location:
+            self.headers['location'] = location
+        self.is_redirect = location is not None
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+def test_redirect_to_private_address_is_rejected(cache, monkeypatch):
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        assert kwargs.get('allow_redirects') is False
+        return FakeResponse(302, location='http://169.254.169.254/latest/meta-data')
+
+    monkeypatch.setattr('image_cache.requests.get', fake_get)
+    with pytest.raises(ImageCacheError) as e:
+        cache.get_original('https://img.runninghub.cn/a.png')
+    assert e.value.status == 400
+    assert calls == ['https://img.runninghub.cn/a.png']
+
+
+def test_redirect_within_allowlist_is_followed(cache, monkeypatch):
+    responses = {
+        'https://img.runninghub.cn/a.png': FakeResponse(301, location='/b.png'),
+        'https://img.runninghub.cn/b.png': FakeResponse(200, body=b'png-bytes'),
+    }
+    monkeypatch.setattr('image_cache.requests.get', lambda url, **kwargs: responses[url])
+    path, _, content_type = cache.get_original('https://img.runninghub.cn/a.png')
+    assert path.read_bytes() == b'png-bytes'
+    assert content_type == 'image/png'
+
+
+def test_cache_hit_does_not_wait_for_stripe_lock(cache, monkeypatch):
+    import threading
+
+    monkeypatch.setattr('image_cache.requests.get',
+                        lambda url, **kwargs: FakeResponse(200, body=b'png-bytes'))
+    url = 'https://img.runninghub.cn/a.png'
+    cache.get_original(url)
+
+    # 模拟同一分段锁上有一个很慢的下载
+    lock = cache._lock_for(cache._url_entry_path(url).name)
+    result = []
+    with lock:
+        worker = threading.Thread(target=lambda: result.append(cache.get_original(url)))
+        worker.start()
+        worker.join(timeout=2)
+    assert result and result[0][0].read_bytes() == b'png-bytes'
+
+
+@pytest.mark.parametrize('content_type', ['image/svg+xml', 'text/html', 'application/octet-stream', ''])
+def test_non_raster_content_is_rejected(cache, monkeypatch, content_type):
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+    monkeypatch.setattr('image_cache.requests.get',
+                        lambda url, **kwargs: FakeResponse(200, body=svg, content_type=content_type))
+    with pytest.raises(ImageCacheError) as e:
+        cache.get('https://img.runninghub.cn/a.png', 400)
+    assert e.value.status == 415
+
+
+def test_raster_content_types_are_accepted(cache, monkeypatch):
+    monkeypatch.setattr('image_cache.requests.get',
+                        lambda url, **kwargs: FakeResponse(200, body=b'jpg', content_type='image/JPG; q=1'))
+    _, _, content_type = cache.get_original('https://img.runninghub.cn/a.jpg')
+    assert content_type == 'image/jpeg'
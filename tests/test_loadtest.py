@@ -0,0 +1,34 @@
+import argparse
+import json
+
+import pytest
+
+from loadtest import percentile, parse_mix, seed_data
+
+
+def test_percentile_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_parse_mix():
+    assert parse_mix("search=50, files=10,,workflow") == {'search': 50, 'files': 10, 'workflow': 1}
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_mix("search=50,unknown=1")
+
+
+def test_seed_data_returns_ids_of_newest_snapshot(tmp_path):
+    result = seed_data(tmp_path, keywords=2, workflows=5, history=3, seed=1)
+    assert len(result) == 2
+    for keyword, ids in result.items():
+        files = sorted((tmp_path / keyword).glob("workflows_*.json"), key=lambda p: p.stat().st_mtime)
+        assert len(files) == 3
+        with open(files[-1], 'r', encoding='utf-8') as f:
+            newest = json.load(f)
+        assert newest['total_count'] == 5
+        assert [w['id'] for w in newest['workflows']] == ids
@@ -0,0 +1,70 @@
+import json
+
+from node_index import NodeIndex, parse_workflow_graph
+
+
+def test_parse_ui_format_with_subgraphs():
+    graph = {
+        "nodes": [
+            {"type": "KSampler", "widgets_values": [42, "fixed", 20]},
+            {"type": "CheckpointLoaderSimple", "widgets_values": ["SDXL\\sd_xl_base_1.0.safetensors"]},
+        ],
+        "definitions": {"subgraphs": [{"nodes": [
+            {"type": "IPAdapterAdvanced", "widgets_values": [{"model": "ip-adapter_sdxl.bin"}]},
+        ]}]},
+    }
+    result = parse_workflow_graph(json.dumps(graph))
+    assert result["node_types"] == ["CheckpointLoaderSimple", "IPAdapterAdvanced", "KSampler"]
+    assert result["models"] == ["ip-adapter_sdxl.bin", "sd_xl_base_1.0.safetensors"]
+
+
+def test_parse_api_format():
+    graph = {
+        "1": {"class_type": "LoraLoader", "inputs": {"lora_name": "styles/anime.safetensors", "model": ["2", 0]}},
+        "2": {"class_type": "UNETLoader", "inputs": {"unet_name": "flux1-dev.gguf"}},
+    }
+    result = parse_workflow_graph(graph)
+    assert result["node_types"] == ["LoraLoader", "UNETLoader"]
+    assert result["models"] == ["anime.safetensors", "flux1-dev.gguf"]
+
+
+def test_parse_invalid_content():
+    empty = {"node_types": [], "models": []}
+    assert parse_workflow_graph("not json") == empty
+    assert parse_workflow_graph(None) == empty
+    assert parse_workflow_graph("[1, 2]") == empty
+
+
+def test_index_lookup_and_replace(tmp_path):
+    index = NodeIndex(str(tmp_path))
+    graph = json.dumps({"nodes": [{"type": "KSampler"}]})
+    index.store_detail("111", {"name": "a", "workflowContent": graph})
+    index.store_detail("222", {"name": "b", "workflowContent": graph})
+    assert index.find_by_node_type("ksampler")["count"] == 2
+
+    # 重新存储时旧的节点类型被移除
+    index.store_detail("222", {"name": "b", "workflowContent": "{}"})
+    result = index.find_by_node_type("KSampler")
+    assert [w["id"] for w in result["workflows"]] == ["111"]
+
+    index.save()
+    assert NodeIndex(str(tmp_path)).summary() == [{"name": "KSampler", "count": 1}]
+
+
+def test_lookup_merges_names_differing_only_in_case(tmp_path):
+    index = NodeIndex(str(tmp_path))
+    upper = json.dumps({"nodes": [{"type": "Loader", "widgets_values": ["Model.safetensors"]}]})
+    lower = json.dumps({"nodes": [{"type": "Loader", "widgets_values": ["model.safetensors"]}]})
+    index.store_detail("11", {"name": "a", "workflowContent": upper})
+    index.store_detail("22", {"name": "b", "workflowContent": lower})
+    assert [w["id"] for w in index.find_by_model("MODEL.safetensors")["workflows"]] == ["11", "22"]
+
+    # 移除其中一种写法后，另一种写法仍能查到
+    index.store_detail("22", {"name": "b", "workflowContent": "{}"})
+    result = index.find_by_model("MODEL.safetensors")
+    assert [w["id"] for w in result["workflows"]] == ["11"]
+    assert result["name"] == "Model.safetensors"
+
+    index.store_detail("11", {"name": "a", "workflowContent": "{}"})
+    assert index.find_by_model("model.safetensors")["count"] == 0
+    assert index._model_names == {}
@@ -0,0 +1,64 @@
+from profiler import Profiler
+
+
+def record(profiler, kind, name, stages):
+    """生成一条剖析记录，stages 为 {阶段名: 耗时毫秒}"""
+    profile = profiler.start(kind, name)
+    for stage, ms in stages.items():
+        profile.add(stage, ms / 1000)
+    return profiler.finish()
+
+
+def test_hotspots_aggregates_stages_by_kind():
+    profiler = Profiler()
+    record(profiler, 'request', 'GET /api/search/a', {'json_load': 30, 'jsonify': 10})
+    record(profiler, 'request', 'GET /api/search/b', {'json_load': 50})
+    record(profiler, 'crawl', 'a', {'upstream': 200})
+
+    result = profiler.hotspots()
+    assert result['profiles'] == 3
+    stages = {(s['kind'], s['stage']): s for s in result['stages']}
+    assert stages[('request', 'json_load')]['count'] == 2
+    assert abs(stages[('request', 'json_load')]['total_ms'] - 80) < 1
+    assert abs(stages[('request', 'json_load')]['max_ms'] - 50) < 1
+    assert result['stages'][0]['stage'] == 'upstream'
+    totals = [p['total_ms'] for p in result['slowest']]
+    assert totals == sorted(totals, reverse=True)
+
+    only_requests = profiler.hotspots(kind='request')
+    assert only_requests['profiles'] == 2
+    assert all(s['kind'] == 'request' for s in only_requests['stages'])
+
+
+def test_stage_is_noop_without_active_profile():
+    profiler = Profiler()
+    with profiler.stage('json_load'):
+        pass
+    assert profiler.finish() is None
+    assert profiler.list_recent() == []
+
+
+def test_get_rejects_glob_patterns(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    saved = record(profiler, 'request', 'GET /api/files', {'file_io': 1})
+
+    # 重新加载后只能从磁盘按 ID 读取
+    reloaded = Profiler(str(tmp_path))
+    reloaded.recent.clear()
+    assert reloaded.get(saved['id'])['id'] == saved['id']
+    assert reloaded.get('*') is None
+    assert reloaded.get('*' * 12) is None
+    assert reloaded.get('../' + saved['id']) is None
+
+
+def test_log_dir_is_pruned(tmp_path):
+    profiler = Profiler(str(tmp_path), max_recent=3)
+    ids = [record(profiler, 'request', f'GET /{i}', {})['id'] for i in range(6)]
+
+    # 同一秒内的多条记录也要保留最新的
+    kept = sorted(tmp_path.glob('*.json'))
+    assert [p.stem.rsplit('_', 1)[-1] for p in kept] == ids[-3:]
+
+    # 重启后按时间顺序加载，最新的在前
+    reloaded = Profiler(str(tmp_path), max_recent=3)
+    assert [p['name'] for p in reloaded.list_recent()] == ['GET /5', 'GET /4', 'GET /3']